@@ -1,13 +1,17 @@
 import streamlit as st
-import json
+import orjson
 import os
-import pandas as pd
-from PIL import Image
 import hashlib
+import hmac
+import io
 import datetime
 from pathlib import Path
-import glob
 import random
+import shutil
+import itertools
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 
 # Page configuration
 st.set_page_config(
@@ -17,8 +21,10 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Custom CSS for better styling
-st.markdown("""
+# Custom CSS for better styling. It has to be emitted on every rerun:
+# Streamlit removes any element a rerun does not re-create, so skipping it
+# after the first run would drop the styling from the page.
+CUSTOM_CSS = """
 <style>
     .main-header {
         font-size: 2.5rem;
@@ -57,19 +63,27 @@ st.markdown("""
         margin: 1rem 0;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
+st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
 
 # Data paths and modalities
 DATA_ROOT = "data"
 MODALITIES = ['CXR', 'MRI', 'CT', 'Pathology']
 DIFFICULTIES = ['easy', 'medium', 'hard']
 LABELS_PATH = "doctor_labels"
+WHITELIST_PATH = "doctor_whitelist.json"
+THUMBNAILS_PATH = "thumbnails"
+DISPLAY_MAX_SIZE = (1460, 1460)  # st.image caps 'stretch' images at 1460 px wide and resizes anything larger
+MAX_EHR_BYTES = 64 * 1024  # reports are a few KB; cap reads so a stray large file can't exhaust memory
+WEB_IMAGE_FORMATS = ('PNG', 'JPEG')
+PNG_MODES = ('1', 'L', 'LA', 'I', 'I;16', 'P', 'RGB', 'RGBA')
+JOURNAL_COMPACT_LINES = 20  # fold a session's label journal into the JSON file this often
 
-# Create labels directory if it doesn't exist
-os.makedirs(LABELS_PATH, exist_ok=True)
-
+@st.cache_resource
 def ensure_data_directories_exist():
     """Create required data directory structure if it doesn't exist."""
+    # Cached so it runs once per server process; a module-level flag would not
+    # work because Streamlit re-executes this script on every rerun
     for modality in MODALITIES:
         images_root = os.path.join(DATA_ROOT, modality, 'images')
         reports_root = os.path.join(DATA_ROOT, modality, 'reports')
@@ -78,78 +92,331 @@ def ensure_data_directories_exist():
             for difficulty in DIFFICULTIES:
                 os.makedirs(os.path.join(root, difficulty), exist_ok=True)
 
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
 def list_image_files(images_dir):
     """List image files in a directory with common extensions."""
-    exts = ('*.png', '*.jpg', '*.jpeg', '*.bmp')
-    files = []
-    for ext in exts:
-        files.extend(glob.glob(os.path.join(images_dir, ext)))
-    # Return just basenames, sorted for stability
-    return sorted([os.path.basename(p) for p in files])
-
-def load_image_data(modality):
+    try:
+        with os.scandir(images_dir) as entries:
+            # Return just basenames, sorted for stability
+            return sorted(
+                entry.name for entry in entries
+                if entry.name.lower().endswith(IMAGE_EXTENSIONS) and entry.is_file()
+            )
+    except FileNotFoundError:
+        return []
+
+def mtime_ns(path):
+    """Modification time of a path in nanoseconds, or None if it doesn't exist."""
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def images_mtimes(modality):
+    """Modification times of a modality's difficulty image directories, for cache keys."""
+    return tuple(mtime_ns(os.path.join(DATA_ROOT, modality, 'images', difficulty)) for difficulty in DIFFICULTIES)
+
+@st.cache_resource(max_entries=2 * len(MODALITIES), show_spinner=False)
+def load_image_data(modality, mtimes=None):
     """Load image data by scanning data/<modality>/images/<difficulty> directories."""
+    # mtimes is only used as part of the cache key so new images invalidate it;
+    # no ttl, so the lists warmed at startup stay cached until the directories change.
+    # The list is shared by every session without copying: callers must not mutate it.
+    images_dirs = [os.path.join(DATA_ROOT, modality, 'images', difficulty) for difficulty in DIFFICULTIES]
+    # Scan the difficulty directories concurrently; map() keeps DIFFICULTIES order
+    with ThreadPoolExecutor(max_workers=len(DIFFICULTIES)) as executor:
+        filenames_by_difficulty = list(executor.map(list_image_files, images_dirs))
     image_data = []
-    for difficulty in DIFFICULTIES:
-        images_dir = os.path.join(DATA_ROOT, modality, 'images', difficulty)
-        filenames = list_image_files(images_dir)
+    for difficulty, filenames in zip(DIFFICULTIES, filenames_by_difficulty):
         for filename in filenames:
             image_data.append({
                 'filename': filename,
                 'modality': modality,
-                'difficulty': difficulty
+                'difficulty': difficulty,
+                # Key under which the label is stored in the doctor's label file
+                'key': f"{difficulty}/{filename}"
             })
     
     # Deterministic randomization: use modality as seed for consistent ordering
     # This ensures the same order every time the app loads, but still randomized
-    random.seed(f"medical_deepfake_{modality}")
-    random.shuffle(image_data)
+    # A private Random instance (same sequence as random.seed) keeps this safe
+    # when the cache-warming thread loads another modality concurrently
+    random.Random(f"medical_deepfake_{modality}").shuffle(image_data)
     return image_data
 
+@st.cache_resource
+def warm_image_data_caches():
+    """Fill the load_image_data cache for every modality once per process, in the background."""
+    def warm():
+        for modality in MODALITIES:
+            load_image_data(modality, images_mtimes(modality))
+
+    # No script run context is attached: cached functions don't need one, and this
+    # thread outlives the session run that started it
+    thread = threading.Thread(target=warm, name="warm-image-data", daemon=True)
+    thread.start()
+    return thread
+
+@st.cache_data(ttl=600, show_spinner=False)
+def report_index(reports_dir, mtime=None):
+    """Map report filenames to paths with a single directory scan."""
+    try:
+        with os.scandir(reports_dir) as entries:
+            return {entry.name: entry.path for entry in entries if entry.is_file()}
+    except FileNotFoundError:
+        return {}
+
 def load_ehr_text(filename, modality, difficulty):
     """Load report text for a given image filename in a modality and difficulty."""
     base, _ = os.path.splitext(filename)
+    reports_dir = os.path.join(DATA_ROOT, modality, 'reports', difficulty)
+    mtime = mtime_ns(reports_dir)
+    if mtime is None:
+        return "Report not found"
+    return read_ehr_text(reports_dir, base, mtime)
+
+@st.cache_data(ttl=600, max_entries=1024, show_spinner=False)
+def read_ehr_text(reports_dir, base, mtime=None):
+    """Read the report for an image basename; cached per reports directory mtime."""
     # Support both .txt and .ehr.txt just in case
     candidate_names = [f"{base}.txt", f"{base}.ehr.txt", f"{base}.report.txt"]
-    reports_dir = os.path.join(DATA_ROOT, modality, 'reports', difficulty)
+    reports = report_index(reports_dir, mtime)
     for name in candidate_names:
-        ehr_path = os.path.join(reports_dir, name)
-        if os.path.exists(ehr_path):
-            with open(ehr_path, 'r') as f:
-                return f.read().strip()
+        ehr_path = reports.get(name)
+        if ehr_path:
+            try:
+                with open(ehr_path, 'rb') as f:
+                    data = f.read(MAX_EHR_BYTES)
+            except FileNotFoundError:
+                continue
+            return data.decode('utf-8', errors='replace').strip()
     return "Report not found"
 
-def get_doctor_file_path(doctor_id, modality):
-    """Get the file path for a doctor's labels for a specific modality"""
+def next_unlabeled_index(image_data_list, doctor_labels, cursor_key):
+    """Return the index of the next unlabeled image, or None if all are labeled"""
+    # Resume from the last position instead of rescanning the list on every rerun
+    start = min(st.session_state.get(cursor_key, 0), len(image_data_list))
+    for index in itertools.chain(range(start, len(image_data_list)), range(start)):
+        image = image_data_list[index]
+        if image['key'] not in doctor_labels:
+            st.session_state[cursor_key] = index
+            return index
+    return None
+
+@st.cache_resource
+def ensure_labels_dir(modality):
+    """Create the labels directory for a modality once per process and return it"""
     modality_dir = os.path.join(LABELS_PATH, modality)
     os.makedirs(modality_dir, exist_ok=True)
-    return os.path.join(modality_dir, f"doctor_{doctor_id}.json")
+    return modality_dir
+
+def get_doctor_file_path(doctor_id, modality):
+    """Get the file path for a doctor's labels for a specific modality"""
+    return os.path.join(ensure_labels_dir(modality), f"doctor_{doctor_id}.json")
+
+def get_doctor_journal_path(doctor_id, modality):
+    """Get the append-only journal path holding label updates not yet compacted"""
+    return os.path.splitext(get_doctor_file_path(doctor_id, modality))[0] + ".jsonl"
+
+@st.cache_resource
+def labels_lock(doctor_id, modality):
+    """Process-wide lock serializing journal appends and compactions of one doctor's labels"""
+    return threading.Lock()
+
+def replay_journal(journal_path, labels):
+    """Apply a journal's updates to labels in place; returns False if it doesn't exist"""
+    try:
+        with open(journal_path, 'rb') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    updates = orjson.loads(line)
+                except orjson.JSONDecodeError:  # a write cut short by a crash
+                    continue
+                for label_key, label_data in updates.items():
+                    if label_data is None:
+                        labels.pop(label_key, None)
+                    else:
+                        labels[label_key] = label_data
+    except FileNotFoundError:
+        return False
+    return True
 
 def load_doctor_labels(doctor_id, modality):
-    """Load existing labels for a doctor and modality"""
+    """Load existing labels for a doctor and modality, compacting the journal into the JSON file"""
     file_path = get_doctor_file_path(doctor_id, modality)
-    if os.path.exists(file_path):
-        with open(file_path, 'r') as f:
-            return json.load(f)
-    return {}
+    journal_path = get_doctor_journal_path(doctor_id, modality)
+    compacting_path = f"{journal_path}.compacting"
+    with labels_lock(doctor_id, modality):
+        # Rotate the journal so concurrent appends go to a fresh one; a leftover
+        # .compacting file is from an interrupted compaction and is finished first
+        if not os.path.exists(compacting_path):
+            try:
+                os.replace(journal_path, compacting_path)
+            except FileNotFoundError:
+                pass
+        # Read the file after rotating, so a compaction finished meanwhile isn't undone
+        try:
+            with open(file_path, 'rb') as f:
+                labels = orjson.loads(f.read())
+        except FileNotFoundError:
+            labels = {}
+        if replay_journal(compacting_path, labels):
+            save_doctor_labels(doctor_id, modality, labels)
+            try:
+                os.remove(compacting_path)
+            except FileNotFoundError:
+                pass
+        # Only non-empty after an interrupted compaction left the journal in place
+        replay_journal(journal_path, labels)
+    return labels
+
+def get_labels(doctor_id, modality):
+    """Return a doctor's labels for a modality, reading the file once per session"""
+    labels_cache = st.session_state.setdefault('labels', {})
+    key = (doctor_id, modality)
+    if key not in labels_cache:
+        labels_cache[key] = load_doctor_labels(doctor_id, modality)
+    return labels_cache[key]
 
 def save_doctor_labels(doctor_id, modality, labels):
     """Save labels for a doctor and modality"""
     file_path = get_doctor_file_path(doctor_id, modality)
-    with open(file_path, 'w') as f:
-        json.dump(labels, f, indent=2)
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(orjson.dumps(labels, option=orjson.OPT_INDENT_2))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, file_path)
+
+def append_doctor_label(doctor_id, modality, labels, label_key, label_data):
+    """Append a single label update (None deletes the label) to the doctor's journal, compacting it periodically"""
+    journal_path = get_doctor_journal_path(doctor_id, modality)
+    with labels_lock(doctor_id, modality):
+        payload = orjson.dumps({label_key: label_data}) + b"\n"
+        # Unbuffered, so a failed or short write can be truncated away
+        with open(journal_path, 'ab', buffering=0) as f:
+            end = f.tell()
+            try:
+                if f.write(payload) != len(payload):
+                    raise OSError(f"Short write to {journal_path}")
+            except OSError:
+                f.truncate(end)
+                raise
+    journal_lines = st.session_state.setdefault('journal_lines', {})
+    key = (doctor_id, modality)
+    journal_lines[key] = journal_lines.get(key, 0) + 1
+    if journal_lines[key] >= JOURNAL_COMPACT_LINES:
+        # Compact from disk: other sessions of this doctor may have appended labels too
+        merged = load_doctor_labels(doctor_id, modality)
+        labels.clear()
+        labels.update(merged)
+        journal_lines[key] = 0
 
 def hash_doctor_id(doctor_id):
     """Create a hash of the doctor ID for security"""
     return hashlib.sha256(doctor_id.encode()).hexdigest()[:16]
 
 def load_whitelist():
-    """Load the doctor whitelist"""
-    whitelist_path = "doctor_whitelist.json"
-    if os.path.exists(whitelist_path):
-        with open(whitelist_path, 'r') as f:
-            return json.load(f)['whitelist']
-    return []
+    """Load the doctor whitelist as (plain IDs, hashed IDs, salt or None)"""
+    whitelist_path = WHITELIST_PATH
+    mtime = mtime_ns(whitelist_path)
+    if mtime is None:
+        return frozenset(), frozenset(), None
+    return _load_whitelist_cached(whitelist_path, mtime)
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def _load_whitelist_cached(whitelist_path, mtime):
+    """Read the whitelist file; cached per (path, mtime)."""
+    try:
+        with open(whitelist_path, 'rb') as f:
+            data = orjson.loads(f.read())
+    except FileNotFoundError:
+        return frozenset(), frozenset(), None
+    ids = frozenset(data.get('whitelist', ()))
+    # 'whitelist_hashes' holds whitelist_digest() values (--prehash), so plaintext IDs
+    # needn't be stored; without 'whitelist_salt' they can't be checked
+    salt = data.get('whitelist_salt')
+    if not salt:
+        return ids, frozenset(), None
+    return ids, frozenset(data.get('whitelist_hashes', ())), salt
+
+def whitelist_digest(doctor_id, salt):
+    """HMAC-SHA256 of a doctor ID keyed with the whitelist's salt, as written by generate_doctor_whitelist.py --prehash"""
+    return hmac.new(bytes.fromhex(salt), doctor_id.encode(), hashlib.sha256).hexdigest()
+
+def is_whitelisted(doctor_id, whitelist):
+    """Check a doctor ID against the plain and hashed whitelist entries"""
+    ids, hashes, salt = whitelist
+    if doctor_id in ids:
+        return True
+    # Not hash_doctor_id(): that hash is unsalted and shown in the sidebar
+    return bool(hashes) and whitelist_digest(doctor_id, salt) in hashes
+
+@st.cache_resource
+def thumbnails_dir():
+    """Create the thumbnail directory for DISPLAY_MAX_SIZE once per process, pruning other sizes"""
+    size_dir = f"{DISPLAY_MAX_SIZE[0]}x{DISPLAY_MAX_SIZE[1]}"
+    path = os.path.join(THUMBNAILS_PATH, size_dir)
+    try:
+        os.makedirs(path, exist_ok=True)
+        with os.scandir(THUMBNAILS_PATH) as entries:
+            for entry in entries:
+                if entry.name == size_dir:
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                else:
+                    os.remove(entry.path)
+    except OSError:
+        pass
+    return path
+
+def thumbnail_path(image_path):
+    """Location of the on-disk display thumbnail for an image"""
+    digest = hashlib.sha256(image_path.encode()).hexdigest()[:32]
+    return os.path.join(thumbnails_dir(), f"{digest}.png")
+
+@st.cache_resource(max_entries=128, show_spinner=False)
+def display_image_bytes(image_path, mtime):
+    """Return (image bytes, format) for st.image, downscaled for display, once per (path, mtime)"""
+    cache_path = thumbnail_path(image_path)
+    try:
+        with open(cache_path, 'rb') as f:
+            # Thumbnails carry their image's mtime, so a stale one is rebuilt in place
+            if os.fstat(f.fileno()).st_mtime_ns == mtime:
+                return f.read(), 'PNG'
+    except FileNotFoundError:
+        pass
+
+    from PIL import Image
+    with Image.open(image_path) as image:
+        # Image.open only parses the header; originals that already fit are served as they are
+        if image.format in WEB_IMAGE_FORMATS and image.width <= DISPLAY_MAX_SIZE[0] and image.height <= DISPLAY_MAX_SIZE[1]:
+            with open(image_path, 'rb') as f:
+                return f.read(), image.format
+        image.load()
+        image = image.copy()
+    image.thumbnail(DISPLAY_MAX_SIZE, Image.LANCZOS)
+    if image.mode not in PNG_MODES:
+        image = image.convert('RGB')
+    # PNG rather than JPEG/WebP: compression artifacts would interfere with judging deepfakes
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    data = buffer.getvalue()
+
+    # The disk copy is only an optimization, so write errors are ignored
+    try:
+        tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.utime(tmp_path, ns=(mtime, mtime))
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass
+    return data, 'PNG'
 
 def authenticate_doctor():
     """Authentication system with whitelist"""
@@ -158,14 +425,14 @@ def authenticate_doctor():
     # Load whitelist
     whitelist = load_whitelist()
     
-    if not whitelist:
+    if not (whitelist[0] or whitelist[1]):
         st.sidebar.error("❌ Whitelist not found. Please contact administrator.")
         return None, None
     
     doctor_id = st.sidebar.text_input("Enter your Doctor ID:", type="password")
     
     if doctor_id:
-        if doctor_id in whitelist:
+        if is_whitelisted(doctor_id, whitelist):
             # Create a simple hash for security
             doctor_hash = hash_doctor_id(doctor_id)
             st.sidebar.success(f"✅ Logged in as Doctor: {doctor_hash}")
@@ -184,11 +451,14 @@ def display_image_and_ehr(image_data, ehr_text, editable=False, key=None):
         st.markdown("### 📸 Medical Image")
         image_path = os.path.join(DATA_ROOT, image_data['modality'], 'images', image_data.get('difficulty', ''), image_data['filename'])
         
-        if os.path.exists(image_path):
-            image = Image.open(image_path)
-            st.image(image, width='stretch')
-        else:
+        try:
+            image, image_format = display_image_bytes(image_path, os.stat(image_path).st_mtime_ns)
+        except OSError:
+            # Missing file, or PIL.UnidentifiedImageError (an OSError subclass)
             st.error(f"Image not found: {image_data['filename']}")
+        else:
+            # Passing the format keeps st.image from re-encoding the bytes as JPEG
+            st.image(image, width='stretch', output_format=image_format)
     
     with col2:
         st.markdown("### 📋 EHR Information")
@@ -227,9 +497,10 @@ def main():
         st.warning("Please enter your Doctor ID in the sidebar to continue.")
         
         # Show whitelist information
-        whitelist = load_whitelist()
-        if whitelist:
-            st.info(f"📋 **Authorized Doctor IDs:** {len(whitelist)} doctors have access to this system.")
+        ids, hashes, _ = load_whitelist()
+        whitelist_size = len(ids) + len(hashes)
+        if whitelist_size:
+            st.info(f"📋 **Authorized Doctor IDs:** {whitelist_size} doctors have access to this system.")
         
         st.markdown("""
         ### About This Application
@@ -258,13 +529,21 @@ def main():
     
     # Ensure data directories exist
     ensure_data_directories_exist()
+    warm_image_data_caches()
 
     # Modality selection
     modality = st.sidebar.selectbox("Select Modality", MODALITIES, index=0)
 
+    # Caches pick up added/removed files on their own; this also forces
+    # edited reports to be re-read before their ttl runs out
+    if st.sidebar.button("🔄 Refresh file list"):
+        load_image_data.clear()
+        report_index.clear()
+        read_ehr_text.clear()
+
     # Load data for selected modality
-    image_data_list = load_image_data(modality)
-    doctor_labels = load_doctor_labels(doctor_id, modality)
+    image_data_list = load_image_data(modality, images_mtimes(modality))
+    doctor_labels = get_labels(doctor_id, modality)
     
     # Doctor info sidebar
     # Labels are already scoped per modality file
@@ -289,32 +568,25 @@ def main():
     # Check if we should show previous labels
     if st.session_state.get('show_previous_labels', False):
         st.markdown("### 📋 Previous Labels")
-        # Reload labels to ensure we have the latest data
-        current_doctor_labels = load_doctor_labels(doctor_id, modality)
-        show_previous_labels(current_doctor_labels, doctor_id, modality)
+        show_previous_labels(doctor_labels, doctor_id, modality)
         
         # Add button to go back to labeling
-        if st.button("← Back to Labeling", width='stretch'):
-            st.session_state.show_previous_labels = False
-            st.rerun()
+        st.button("← Back to Labeling", width='stretch', on_click=set_show_previous_labels, args=(False,))
         return
     
     # Find next unlabeled image
-    def make_label_key(difficulty, filename):
-        return f"{difficulty}/{filename}"
-
-    unlabeled_images = [img for img in image_data_list if make_label_key(img['difficulty'], img['filename']) not in doctor_labels]
+    current_index = next_unlabeled_index(image_data_list, doctor_labels, f"cursor_{modality}")
     
-    if not unlabeled_images:
+    if current_index is None:
         st.success(f"🎉 Congratulations! You have labeled all images for {modality}.")
         st.markdown(f"### 📊 Your Labeling Summary — {modality}")
         
         # Show summary statistics
         if doctor_labels:
-            confidence_counts = {}
-            for filename, label_data in doctor_labels.items():
-                confidence = label_data.get('doctor_confidence') or label_data.get('doctor_difficulty') or 'Unknown'
-                confidence_counts[confidence] = confidence_counts.get(confidence, 0) + 1
+            confidence_counts = Counter(
+                label_data.get('doctor_confidence') or label_data.get('doctor_difficulty') or 'Unknown'
+                for label_data in doctor_labels.values()
+            )
             
             col1, col2, col3 = st.columns(3)
             for i, (confidence, count) in enumerate(confidence_counts.items()):
@@ -323,22 +595,51 @@ def main():
         
         # Always show previous labels management when all images are labeled
         st.markdown("---")
-        # Reload labels to ensure we have the latest data
-        current_doctor_labels = load_doctor_labels(doctor_id, modality)
-        show_previous_labels(current_doctor_labels, doctor_id, modality)
+        show_previous_labels(doctor_labels, doctor_id, modality)
         return
     
-    # Display current image - pick a deterministic random unlabeled image
-    # Use a seed based on the number of unlabeled images for consistent selection
-    if unlabeled_images:
-        random.seed(f"selection_{len(unlabeled_images)}_{modality}")
-        current_image = random.choice(unlabeled_images)
-    else:
-        current_image = None
+    # Display current image - image_data_list is already in a deterministic random order
+    current_image = image_data_list[current_index]
+    ehr_key = f"ehr_{current_image['filename']}_{current_image['difficulty']}"
+    reasoning_key = f"reasoning_{current_image['filename']}_{current_image['difficulty']}"
+    labeling_panel(modality, current_image, doctor_labels, ehr_key, reasoning_key)
+    
+    # Buttons save through on_click callbacks, which run before the next rerun, so
+    # one click is one script run. They sit outside the fragment so that run is a
+    # full rerun and the sidebar progress stays current.
+    def label_button(column, label, confidence):
+        with column:
+            st.button(
+                label,
+                width='stretch',
+                on_click=save_label_from_widgets,
+                args=(doctor_id, modality, current_image['key'], confidence, current_image, ehr_key, reasoning_key)
+            )
+    
+    col1, col2, col3, col4, col5 = st.columns(5)
+    label_button(col1, "1️⃣ Very Low", "very_low")
+    label_button(col2, "2️⃣ Low", "low")
+    label_button(col3, "3️⃣ Medium", "medium")
+    label_button(col4, "4️⃣ High", "high")
+    label_button(col5, "5️⃣ Very High", "very_high")
+    
+    # Additional options
+    st.markdown("### 📝 Additional Options")
+    
+    col1, col2, col3 = st.columns(3)
+    label_button(col1, "⏭️ Skip This Image", "skipped")
+    label_button(col2, "🗑️ Drop (Too fake to include)", "dropped")
+    
+    with col3:
+        st.button("🔄 View Previous Labels", width='stretch', on_click=set_show_previous_labels, args=(True,))
+
+@st.fragment
+def labeling_panel(modality, current_image, doctor_labels, ehr_key, reasoning_key):
+    """Show the current image with its editable EHR, the rating guidance and the reasoning box"""
+    # A fragment, so editing the EHR or reasoning reruns only this panel
     ehr_text = load_ehr_text(current_image['filename'], modality, current_image['difficulty'])
     # Prefer edited EHR if already saved for this image
-    current_label_key = make_label_key(current_image['difficulty'], current_image['filename'])
-    existing_label = doctor_labels.get(current_label_key)
+    existing_label = doctor_labels.get(current_image['key'])
     if existing_label:
         saved_ehr_text = existing_label.get('ehr_text')
         if saved_ehr_text:
@@ -347,8 +648,7 @@ def main():
     st.markdown("### Current Image")
     
     # Display image and EHR (EHR editable)
-    ehr_key = f"ehr_{current_image['filename']}_{current_image['difficulty']}"
-    ehr_text = display_image_and_ehr(current_image, ehr_text, editable=True, key=ehr_key)
+    display_image_and_ehr(current_image, ehr_text, editable=True, key=ehr_key)
     
     # Confidence rating interface
     st.markdown("### 🎯 Deepfake Confidence Rating")
@@ -372,68 +672,29 @@ def main():
     """, unsafe_allow_html=True)
     
     # Add reasoning text input with unique key per image
-    reasoning_key = f"reasoning_{current_image['filename']}_{current_image['difficulty']}"
-    reasoning = st.text_area(
+    st.text_area(
         "💭 Reasoning (Optional):",
         placeholder="Explain your decision... What makes this image easy/medium/hard to detect as a deepfake?",
         height=100,
         key=reasoning_key
     )
-    
-    col1, col2, col3, col4, col5 = st.columns(5)
-    
-    
-    with col1:
-        if st.button("1️⃣ Very Low", width='stretch'): 
-            save_label(doctor_id, modality, make_label_key(current_image['difficulty'], current_image['filename']), "very_low", current_image, ehr_text, reasoning)
-            st.rerun()
-    
-    with col2:
-        if st.button("2️⃣ Low", width='stretch'):
-            save_label(doctor_id, modality, make_label_key(current_image['difficulty'], current_image['filename']), "low", current_image, ehr_text, reasoning)
-            st.rerun()
-    
-    with col3:
-        if st.button("3️⃣ Medium", width='stretch'):
-            save_label(doctor_id, modality, make_label_key(current_image['difficulty'], current_image['filename']), "medium", current_image, ehr_text, reasoning)
-            st.rerun()
 
-    with col4:
-        if st.button("4️⃣ High", width='stretch'):
-            save_label(doctor_id, modality, make_label_key(current_image['difficulty'], current_image['filename']), "high", current_image, ehr_text, reasoning)
-            st.rerun()
+def set_show_previous_labels(value):
+    """Button callback: switch between the labeling view and the previous labels view"""
+    st.session_state.show_previous_labels = value
 
-    with col5:
-        if st.button("5️⃣ Very High", width='stretch'):
-            save_label(doctor_id, modality, make_label_key(current_image['difficulty'], current_image['filename']), "very_high", current_image, ehr_text, reasoning)
-            st.rerun()
-    
-    # Additional options
-    st.markdown("### 📝 Additional Options")
-    
-    col1, col2, col3 = st.columns(3)
-    
-    with col1:
-        if st.button("⏭️ Skip This Image", width='stretch'):
-            save_label(doctor_id, modality, make_label_key(current_image['difficulty'], current_image['filename']), "skipped", current_image, ehr_text, reasoning)
-            st.rerun()
-    
-    with col2:
-        if st.button("🗑️ Drop (Too fake to include)", width='stretch'):
-            save_label(doctor_id, modality, make_label_key(current_image['difficulty'], current_image['filename']), "dropped", current_image, ehr_text, reasoning)
-            st.rerun()
-
-    with col3:
-        if st.button("🔄 View Previous Labels", width='stretch'):
-            # Set session state to show previous labels
-            st.session_state.show_previous_labels = True
-            st.rerun()
+def save_label_from_widgets(doctor_id, modality, label_key, difficulty, image_data, ehr_key, reasoning_key):
+    """Button callback: save a label using the EHR and reasoning currently in their widgets"""
+    save_label(
+        doctor_id, modality, label_key, difficulty, image_data,
+        st.session_state.get(ehr_key, ""), st.session_state.get(reasoning_key, "")
+    )
 
 def save_label(doctor_id, modality, label_key, difficulty, image_data, ehr_text, reasoning=""):
     """Save a label for the current image"""
     
     print(f"Saving label: {label_key}, {difficulty}, {image_data}, {ehr_text}, {reasoning}")
-    doctor_labels = load_doctor_labels(doctor_id, modality)
+    doctor_labels = get_labels(doctor_id, modality)
     
     label_data = {
         'doctor_confidence': difficulty,
@@ -445,17 +706,18 @@ def save_label(doctor_id, modality, label_key, difficulty, image_data, ehr_text,
         'reasoning': reasoning.strip() if reasoning else ""
     }
     
+    # Only record the label in the session once it has reached the journal
+    append_doctor_label(doctor_id, modality, doctor_labels, label_key, label_data)
     doctor_labels[label_key] = label_data
-    save_doctor_labels(doctor_id, modality, doctor_labels)
     
     st.success(f"✅ Saved: Confidence = {difficulty.replace('_', ' ').title()}")
 
 def delete_label(doctor_id, modality, label_key):
     """Delete a label for a specific image"""
-    doctor_labels = load_doctor_labels(doctor_id, modality)
+    doctor_labels = get_labels(doctor_id, modality)
     if label_key in doctor_labels:
-        del doctor_labels[label_key]
-        save_doctor_labels(doctor_id, modality, doctor_labels)
+        append_doctor_label(doctor_id, modality, doctor_labels, label_key, None)
+        doctor_labels.pop(label_key, None)
         st.success(f"✅ Label deleted for {label_key}")
         return True
     return False
@@ -482,8 +744,17 @@ def show_previous_labels(doctor_labels, doctor_id, modality):
             if reasoning:
                 st.write(f"**Reasoning:** {reasoning}")
             
-            # Reconstruct image data for display
-            difficulty, filename = label_key.split('/', 1)
+            # Only decode the image and build the editing UI once the doctor asks
+            # for it: Streamlit runs every expander body on each rerun, even collapsed ones
+            if not st.toggle("Show image and edit", key=f"load_{label_key}"):
+                continue
+            
+            # Reconstruct image data for display; save_label stores both fields,
+            # older labels may only have them encoded in the key
+            difficulty = label_data.get('difficulty')
+            filename = label_data.get('filename')
+            if not (difficulty and filename):
+                difficulty, filename = label_key.split('/', 1)
             image_data = {
                 'filename': filename,
                 'modality': modality,
@@ -492,14 +763,13 @@ def show_previous_labels(doctor_labels, doctor_id, modality):
             
             # Load the report text and prefer edited EHR from JSON if present
             ehr_text = load_ehr_text(filename, modality, difficulty)
-            saved = doctor_labels.get(label_key)
-            if saved and saved.get('ehr_text'):
-                ehr_text = saved.get('ehr_text')
+            if label_data.get('ehr_text'):
+                ehr_text = label_data['ehr_text']
             
             # Display image and report
             # Display image and EHR (EHR editable in edit view)
             ehr_edit_key = f"ehr_edit_{label_key}"
-            ehr_text = display_image_and_ehr(image_data, ehr_text, editable=True, key=ehr_edit_key)
+            display_image_and_ehr(image_data, ehr_text, editable=True, key=ehr_edit_key)
             
             # Embedded editing UI
             st.markdown("### 🎯 Change Confidence")
@@ -523,51 +793,42 @@ def show_previous_labels(doctor_labels, doctor_id, modality):
             """, unsafe_allow_html=True)
             
             # Add reasoning text input for editing
-            edit_reasoning = st.text_area(
+            edit_reasoning_key = f"edit_reasoning_{label_key}"
+            st.text_area(
                 "💭 Update Reasoning (Optional):",
                 value=reasoning,
                 placeholder="Explain your decision... What makes this image easy/medium/hard to detect as a deepfake?",
                 height=80,
-                key=f"edit_reasoning_{label_key}"
+                key=edit_reasoning_key
             )
+            widget_keys = (ehr_edit_key, edit_reasoning_key)
             
             # Save EHR without changing the current confidence
             current_conf = label_data.get('doctor_confidence') or label_data.get('doctor_difficulty') or 'medium'
-            if st.button("💾 Save EHR Only", key=f"save_ehr_only_{label_key}"):
-                save_label(doctor_id, modality, label_key, current_conf, image_data, ehr_text, edit_reasoning)
-                st.rerun()
-            
-            col1, col2, col3, col4, col5, col6 = st.columns(6)
-            
-            with col1:
-                if st.button("1️⃣ Very Low", key=f"edit_vlow_{label_key}"):
-                    save_label(doctor_id, modality, label_key, "very_low", image_data, ehr_text, edit_reasoning)
-                    st.rerun()
-            
-            with col2:
-                if st.button("2️⃣ Low", key=f"edit_low_{label_key}"):
-                    save_label(doctor_id, modality, label_key, "low", image_data, ehr_text, edit_reasoning)
-                    st.rerun()
+            st.button(
+                "💾 Save EHR Only",
+                key=f"save_ehr_only_{label_key}",
+                on_click=save_label_from_widgets,
+                args=(doctor_id, modality, label_key, current_conf, image_data, *widget_keys)
+            )
             
-            with col3:
-                if st.button("3️⃣ Medium", key=f"edit_med_{label_key}"):
-                    save_label(doctor_id, modality, label_key, "medium", image_data, ehr_text, edit_reasoning)
-                    st.rerun()
-
-            with col4:
-                if st.button("4️⃣ High", key=f"edit_high_{label_key}"):
-                    save_label(doctor_id, modality, label_key, "high", image_data, ehr_text, edit_reasoning)
-                    st.rerun()
-
-            with col5:
-                if st.button("5️⃣ Very High", key=f"edit_vhigh_{label_key}"):
-                    save_label(doctor_id, modality, label_key, "very_high", image_data, ehr_text, edit_reasoning)
-                    st.rerun()
-
-            with col6:
-                if st.button("🗑️ Drop", key=f"edit_drop_{label_key}"):
-                    save_label(doctor_id, modality, label_key, "dropped", image_data, ehr_text, edit_reasoning)
-                    st.rerun()
+            columns = st.columns(6)
+            edit_buttons = [
+                ("1️⃣ Very Low", "vlow", "very_low"),
+                ("2️⃣ Low", "low", "low"),
+                ("3️⃣ Medium", "med", "medium"),
+                ("4️⃣ High", "high", "high"),
+                ("5️⃣ Very High", "vhigh", "very_high"),
+                ("🗑️ Drop", "drop", "dropped"),
+            ]
+            for column, (label, key_suffix, confidence) in zip(columns, edit_buttons):
+                with column:
+                    st.button(
+                        label,
+                        key=f"edit_{key_suffix}_{label_key}",
+                        on_click=save_label_from_widgets,
+                        args=(doctor_id, modality, label_key, confidence, image_data, *widget_keys)
+                    )
 
 if __name__ == "__main__":
     main()
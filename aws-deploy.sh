@@ -30,11 +30,12 @@ fi
 
 # Create necessary directories
 echo "📁 Creating necessary directories..."
-mkdir -p doctor_labels logs
+mkdir -p doctor_labels thumbnails logs
 
 # Set proper permissions
 echo "🔐 Setting permissions..."
 chmod 755 doctor_labels
+chmod 755 thumbnails
 chmod 755 logs
 
 # Build and run with production Docker Compose
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Script to fold every doctor's label journal into their doctor_{id}.json file.
+
+The app appends each label to doctor_labels/{modality}/doctor_{id}.jsonl and only
+compacts it into doctor_{id}.json from time to time, so run this before exporting
+or analyzing the labels.
+"""
+
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+LABELS_PATH = "doctor_labels"
+
+def json_loads(data):
+    """Parse JSON bytes, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def dump_json_bytes(data):
+    """Serialize data as indented UTF-8 JSON, the same way app.py writes label files"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    return json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8')
+
+def replay_journal(journal_path, labels):
+    """Apply a journal's updates to labels in place; returns False if it doesn't exist"""
+    try:
+        with open(journal_path, 'rb') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    updates = json_loads(line)
+                except ValueError:  # a write cut short by a crash
+                    continue
+                for label_key, label_data in updates.items():
+                    if label_data is None:
+                        labels.pop(label_key, None)
+                    else:
+                        labels[label_key] = label_data
+    except FileNotFoundError:
+        return False
+    return True
+
+def compact_labels(file_path):
+    """Compact the journal of one doctor_{id}.json file the same way app.py does"""
+    journal_path = os.path.splitext(file_path)[0] + ".jsonl"
+    compacting_path = f"{journal_path}.compacting"
+    if not os.path.exists(compacting_path):
+        try:
+            os.replace(journal_path, compacting_path)
+        except FileNotFoundError:
+            return False
+    try:
+        with open(file_path, 'rb') as f:
+            labels = json_loads(f.read())
+    except FileNotFoundError:
+        labels = {}
+    if not replay_journal(compacting_path, labels):
+        return False
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(dump_json_bytes(labels))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, file_path)
+    try:
+        os.remove(compacting_path)
+    except FileNotFoundError:
+        pass
+    return True
+
+def compact_doctor_labels():
+    """Compact the label journals of every doctor and modality"""
+    if not os.path.isdir(LABELS_PATH):
+        print(f"❌ Error: {LABELS_PATH} directory not found!")
+        return
+
+    compacted = 0
+    for modality in sorted(os.listdir(LABELS_PATH)):
+        modality_dir = os.path.join(LABELS_PATH, modality)
+        if not os.path.isdir(modality_dir):
+            continue
+        # A doctor may only have a journal, so list label files from every name variant
+        bases = set()
+        for name in os.listdir(modality_dir):
+            if name.startswith("doctor_") and name.endswith((".json", ".jsonl", ".jsonl.compacting")):
+                bases.add(name.split(".", 1)[0])
+        for base in sorted(bases):
+            file_path = os.path.join(modality_dir, f"{base}.json")
+            if compact_labels(file_path):
+                compacted += 1
+                print(f"✅ Compacted: {file_path}")
+
+    print(f"📊 Label files updated: {compacted}")
+
+if __name__ == "__main__":
+    compact_doctor_labels()
@@ -33,7 +33,7 @@ fi
 
 # Create necessary directories
 echo "📁 Creating necessary directories..."
-mkdir -p doctor_labels logs
+mkdir -p doctor_labels thumbnails logs
 
 # Build and run with Docker Compose
 echo "🐳 Building and starting the application..."
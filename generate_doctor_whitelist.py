@@ -14,29 +14,51 @@ Options:
     --from-file FILE Import doctor IDs from a text file (one per line)
     --from-csv FILE  Import doctor IDs from a CSV file
     --pattern PAT    Custom pattern for random IDs (default: "DOC{number}")
+    --prehash        Store only hashed IDs instead of the plaintext IDs
     --output FILE    Output file (default: doctor_whitelist.json)
     --help           Show this help message
 """
 
+import hashlib
+import hmac
 import json
 import os
 import sys
 import argparse
 import random
+import secrets
 import string
 import csv
 from datetime import datetime
 from pathlib import Path
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def dump_json_bytes(data):
+    """Serialize data as indented UTF-8 JSON, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    return json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8')
+
+def whitelist_digest(doctor_id, salt):
+    """HMAC-SHA256 of a doctor ID keyed with the whitelist's salt, checked the same way by app.py"""
+    return hmac.new(bytes.fromhex(salt), doctor_id.encode(), hashlib.sha256).hexdigest()
+
 class DoctorWhitelistGenerator:
     def __init__(self):
         self.whitelist = []
+        self._whitelist_set = set()  # mirrors self.whitelist for O(1) duplicate checks
         self.created_time = datetime.now().isoformat()
     
     def add_doctor_id(self, doctor_id):
         """Add a doctor ID to the whitelist if it's not already present"""
-        if doctor_id.strip() and doctor_id not in self.whitelist:
-            self.whitelist.append(doctor_id.strip())
+        doctor_id = doctor_id.strip()
+        if doctor_id and doctor_id not in self._whitelist_set:
+            self.whitelist.append(doctor_id)
+            self._whitelist_set.add(doctor_id)
             return True
         return False
     
@@ -49,33 +71,35 @@ class DoctorWhitelistGenerator:
         id_str = pattern.replace("{number}", str(number))
         id_str = id_str.replace("{random}", ''.join(random.choices(string.ascii_uppercase + string.digits, k=4)))
         id_str = id_str.replace("{letter}", random.choice(string.ascii_uppercase))
+        # Unguessable part for IDs stored only as hashes (--prehash)
+        id_str = id_str.replace("{token}", secrets.token_hex(8).upper())
         
         return id_str
     
     def generate_random_ids(self, count, pattern="DOC{number}"):
         """Generate multiple random doctor IDs"""
         generated = []
+        generated_set = set()
         attempts = 0
         max_attempts = count * 10  # Prevent infinite loops
         
         while len(generated) < count and attempts < max_attempts:
             attempts += 1
             new_id = self.generate_random_id(pattern)
-            if new_id not in generated and new_id not in self.whitelist:
+            if new_id not in generated_set and new_id not in self._whitelist_set:
                 generated.append(new_id)
+                generated_set.add(new_id)
         
         return generated
     
     def load_from_file(self, filename):
         """Load doctor IDs from a text file (one per line)"""
         try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-            
             added_count = 0
-            for line in lines:
-                if self.add_doctor_id(line.strip()):
-                    added_count += 1
+            with open(filename, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if self.add_doctor_id(line.strip()):
+                        added_count += 1
             
             return added_count
         except FileNotFoundError:
@@ -88,14 +112,10 @@ class DoctorWhitelistGenerator:
     def load_from_csv(self, filename, column=0):
         """Load doctor IDs from a CSV file"""
         try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                reader = csv.reader(f)
-                rows = list(reader)
-            
             added_count = 0
-            for row in rows:
-                if len(row) > column:
-                    if self.add_doctor_id(row[column]):
+            with open(filename, 'r', encoding='utf-8', newline='') as f:
+                for row in csv.reader(f):
+                    if len(row) > column and self.add_doctor_id(row[column]):
                         added_count += 1
             
             return added_count
@@ -126,17 +146,24 @@ class DoctorWhitelistGenerator:
         
         print(f"\n📋 Total doctor IDs entered: {len(self.whitelist)}")
     
-    def save_whitelist(self, output_file="doctor_whitelist.json"):
-        """Save the whitelist to a JSON file"""
+    def save_whitelist(self, output_file="doctor_whitelist.json", prehash=False):
+        """Save the whitelist to a JSON file, optionally storing only hashed IDs"""
         data = {
             "created": self.created_time,
             "total_doctors": len(self.whitelist),
-            "whitelist": sorted(self.whitelist)  # Sort for consistency
         }
+        if prehash:
+            salt = secrets.token_hex(16)
+            data["whitelist_salt"] = salt
+            data["whitelist_hashes"] = sorted(whitelist_digest(doctor_id, salt) for doctor_id in self.whitelist)
+        else:
+            data["whitelist"] = sorted(self.whitelist)  # Sort for consistency
         
         try:
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            # Serialize up front so the file is written with a single write()
+            payload = dump_json_bytes(data)
+            with open(output_file, 'wb') as f:
+                f.write(payload)
             
             print(f"✅ Whitelist saved to: {output_file}")
             print(f"📊 Total doctors: {len(self.whitelist)}")
@@ -180,6 +207,9 @@ Examples:
   
   # Combine multiple sources
   python generate_doctor_whitelist.py --random 5 --from-file doctors.txt --output custom_whitelist.json
+  
+  # Store only hashed IDs (plaintext IDs are printed once)
+  python generate_doctor_whitelist.py --random 10 --pattern "DOC_{token}" --prehash
         """
     )
     
@@ -192,11 +222,13 @@ Examples:
     parser.add_argument('--from-csv', metavar='FILE',
                        help='Import doctor IDs from CSV file')
     parser.add_argument('--pattern', default='DOC{number}',
-                       help='Pattern for random IDs (default: DOC{number})')
+                       help='Pattern for random IDs (default: DOC{number}); placeholders: {number}, {random}, {letter}, {token}')
     parser.add_argument('--output', default='doctor_whitelist.json',
                        help='Output file (default: doctor_whitelist.json)')
     parser.add_argument('--show', action='store_true',
                        help='Display the generated whitelist')
+    parser.add_argument('--prehash', action='store_true',
+                       help='Store only salted hashes of the IDs so plaintext IDs are not kept on the server')
     
     args = parser.parse_args()
     
@@ -230,9 +262,9 @@ Examples:
     
     # Save the whitelist
     if generator.whitelist:
-        generator.save_whitelist(args.output)
+        generator.save_whitelist(args.output, prehash=args.prehash)
         
-        if args.show:
+        if args.show or args.prehash:
             print()
             generator.display_whitelist()
         
@@ -242,6 +274,9 @@ Examples:
         print(f"- Each doctor should use their assigned ID only")
         print(f"- IDs are hashed for privacy in the system")
         print(f"- File saved as: {args.output}")
+        if args.prehash:
+            print(f"- Only salted hashes were saved: distribute the IDs listed above now, show_doctor_ids.py cannot list them")
+            print(f"- Hashing doesn't stop anyone with the file from guessing predictable IDs: use --pattern \"DOC_{{token}}\" or IDs just as hard to guess")
         
         # Show how to use the whitelist
         print(f"\n📋 To view the whitelist later:")
@@ -3,9 +3,13 @@
 Script to display the authorized doctor IDs for distribution to medical professionals.
 """
 
-import json
 import os
 
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
 def show_doctor_ids():
     """Display the authorized doctor IDs"""
     whitelist_path = "doctor_whitelist.json"
@@ -14,14 +18,19 @@ def show_doctor_ids():
         print("❌ Error: doctor_whitelist.json not found!")
         return
     
-    with open(whitelist_path, 'r') as f:
-        data = json.load(f)
+    with open(whitelist_path, 'rb') as f:
+        data = json_loads(f.read())
     
     print("🏥 Medical Deepfake Labeling - Authorized Doctor IDs")
     print("=" * 60)
     print(f"Total authorized doctors: {data['total_doctors']}")
     print(f"Created: {data['created']}")
     print()
+    if 'whitelist' not in data:
+        print("🔒 This whitelist only stores salted hashes of the IDs (generated with --prehash).")
+        print("The plaintext IDs were only shown when it was generated; this script cannot list them.")
+        return
+    
     print("📋 Doctor IDs to distribute:")
     print("-" * 30)
     